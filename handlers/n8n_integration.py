@@ -7,6 +7,7 @@ enhanced AI agent capabilities with MCP tools (Gmail, Calendar, Tasks, etc.)
 """
 
 import os
+import time
 import logging
 import requests
 from typing import Optional, Dict, Any
@@ -18,6 +19,7 @@ N8N_ENABLED = os.getenv("N8N_ENABLED", "false").lower() == "true"
 N8N_WEBHOOK_URL = os.getenv("N8N_WEBHOOK_URL", "http://n8n:5678")
 N8N_WEBHOOK_PATH = os.getenv("N8N_WEBHOOK_PATH", "/webhook/whatsapp-webhook")
 N8N_TIMEOUT = int(os.getenv("N8N_TIMEOUT", "60"))
+HEALTH_CACHE_TTL = float(os.getenv("HEALTH_CACHE_TTL", "1"))
 
 
 class N8NClient:
@@ -28,6 +30,15 @@ class N8NClient:
         self.base_url = N8N_WEBHOOK_URL.rstrip('/')
         self.webhook_path = N8N_WEBHOOK_PATH
         self.timeout = N8N_TIMEOUT
+        self.health_ttl = HEALTH_CACHE_TTL
+        self._health_checked_at = float("-inf")
+        self._health_ok = False
+        # Reuse keep-alive connections to n8n across calls
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=20)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
         
     @property
     def webhook_url(self) -> str:
@@ -35,19 +46,27 @@ class N8NClient:
         return f"{self.base_url}{self.webhook_path}"
     
     def is_available(self) -> bool:
-        """Check if n8n is available and responding"""
+        """Check if n8n is available and responding (cached for health_ttl seconds)"""
         if not self.enabled:
             return False
+        
+        if time.monotonic() - self._health_checked_at < self.health_ttl:
+            return self._health_ok
             
         try:
-            response = requests.get(
+            response = self.session.head(
                 f"{self.base_url}/healthz",
                 timeout=5
             )
-            return response.status_code == 200
+            ok = response.status_code == 200
         except Exception as e:
-            logger.warning(f"n8n health check failed: {e}")
-            return False
+            logger.warning("n8n health check failed: %s", e)
+            ok = False
+        
+        # Stamp after the probe so a slow (up to 5 s) check still caches
+        self._health_checked_at = time.monotonic()
+        self._health_ok = ok
+        return ok
     
     def forward_message(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """
@@ -67,28 +86,25 @@ class N8NClient:
             return None
             
         try:
-            logger.info(f"Forwarding message to n8n: {self.webhook_url}")
-            
-            response = requests.post(
+            response = self.session.post(
                 self.webhook_url,
                 json=payload,
-                headers={"Content-Type": "application/json"},
                 timeout=self.timeout
             )
             
             if response.status_code == 200:
                 result = response.json()
-                logger.info(f"n8n workflow executed successfully")
+                logger.info("n8n workflow executed successfully: %s", self.webhook_url)
                 return result
             else:
-                logger.error(f"n8n webhook returned {response.status_code}: {response.text}")
+                logger.error("n8n webhook returned %s: %s", response.status_code, response.text)
                 return None
                 
         except requests.Timeout:
-            logger.error(f"n8n webhook timed out after {self.timeout}s")
+            logger.error("n8n webhook timed out after %ss", self.timeout)
             return None
         except Exception as e:
-            logger.error(f"Error forwarding to n8n: {e}")
+            logger.error("Error forwarding to n8n: %s", e)
             return None
     
     def trigger_workflow(self, workflow_path: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -107,27 +123,35 @@ class N8NClient:
             
         try:
             url = f"{self.base_url}{workflow_path}"
-            response = requests.post(
+            response = self.session.post(
                 url,
                 json=data,
-                headers={"Content-Type": "application/json"},
                 timeout=self.timeout
             )
             
             if response.status_code == 200:
                 return response.json()
             else:
-                logger.error(f"Workflow {workflow_path} returned {response.status_code}")
+                logger.error("Workflow %s returned %s", workflow_path, response.status_code)
                 return None
                 
         except Exception as e:
-            logger.error(f"Error triggering workflow {workflow_path}: {e}")
+            logger.error("Error triggering workflow %s: %s", workflow_path, e)
             return None
 
 
 # Global client instance
 n8n_client = N8NClient()
 
+# Keywords that suggest MCP tool usage (better handled by n8n)
+N8N_KEYWORDS = (
+    'email', 'mail', 'inbox', 'send email', 'draft',
+    'calendar', 'schedule', 'meeting', 'appointment', 'event',
+    'task', 'todo', 'reminder', 'due',
+    'expense', 'spent', 'budget', 'track expense',
+    'contact', 'address book'
+)
+
 
 def should_use_n8n(message: str) -> bool:
     """
@@ -147,22 +171,8 @@ def should_use_n8n(message: str) -> bool:
     if not n8n_client.enabled:
         return False
     
-    # Keywords that suggest MCP tool usage (better handled by n8n)
-    n8n_keywords = [
-        'email', 'mail', 'inbox', 'send email', 'draft',
-        'calendar', 'schedule', 'meeting', 'appointment', 'event',
-        'task', 'todo', 'reminder', 'due',
-        'expense', 'spent', 'budget', 'track expense',
-        'contact', 'address book'
-    ]
-    
     message_lower = message.lower()
-    
-    for keyword in n8n_keywords:
-        if keyword in message_lower:
-            return True
-    
-    return False
+    return any(keyword in message_lower for keyword in N8N_KEYWORDS)
 
 
 def process_via_n8n(phone: str, message: str, payload: Dict[str, Any]) -> Optional[str]:
@@ -8,23 +8,50 @@ WhatsApp management endpoints (QR, status, send).
 
 import os
 import time
-import json
+import queue
+import atexit
 import logging
+import threading
 import requests
+from collections import defaultdict, deque
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener
 
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify
+from waitress import serve
 
 load_dotenv()
 
 # ---------------------------------------------------------------------------
 # Logging
 # ---------------------------------------------------------------------------
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-)
+def _setup_logging() -> None:
+    """Route root logging through a QueueHandler and a background listener.
+
+    QueueHandler still merges the message and its args on the calling
+    thread; the asctime formatting and the stderr write happen on the
+    listener thread. Like basicConfig, this is a no-op if the root logger
+    already has handlers (e.g. configured by the hosting server or a
+    second import).
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    log_queue: queue.Queue = queue.Queue(-1)
+    stream = logging.StreamHandler()
+    stream.setFormatter(
+        logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    )
+    listener = QueueListener(log_queue, stream)
+    listener.start()
+    atexit.register(listener.stop)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+
+
+_setup_logging()
 logger = logging.getLogger("wednesday")
 
 # ---------------------------------------------------------------------------
@@ -43,7 +70,20 @@ WAHA_HEALTH_URL = os.getenv(
     "WAHA_HEALTH_URL", WAHA_URL.rsplit("/api", 1)[0] + "/health"
 )
 
+# Derived endpoints, resolved once instead of on every request
+N8N_FORWARD_URL = f"{N8N_WEBHOOK_URL}{N8N_WEBHOOK_PATH}"
+N8N_HEALTH_URL = f"{N8N_WEBHOOK_URL}/healthz"
+WAHA_BASE_URL = (
+    WAHA_URL.rsplit("/api", 1)[0] if "/api/" in WAHA_URL else WAHA_URL
+)
+WAHA_SEND_URL = WAHA_URL if "/api/" in WAHA_URL else f"{WAHA_URL}/api/sendText"
+
 MAX_REQUESTS_PER_MINUTE = int(os.getenv("RATE_LIMIT", "30"))
+HEALTH_CACHE_TTL = float(os.getenv("HEALTH_CACHE_TTL", "1"))
+
+# Each /webhook holds a server thread for up to N8N_TIMEOUT while n8n
+# runs the agent, so this is the number of conversations in flight.
+WAITRESS_THREADS = int(os.getenv("WAITRESS_THREADS", "32"))
 
 # ---------------------------------------------------------------------------
 # Flask app
@@ -51,30 +91,61 @@ MAX_REQUESTS_PER_MINUTE = int(os.getenv("RATE_LIMIT", "30"))
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY") or os.urandom(24)
 
+# ---------------------------------------------------------------------------
+# Outbound HTTP — one pooled session so n8n/WAHA calls reuse connections
+# ---------------------------------------------------------------------------
+_http = requests.Session()
+_http_adapter = requests.adapters.HTTPAdapter(
+    pool_connections=4, pool_maxsize=32, max_retries=0
+)
+_http.mount("http://", _http_adapter)
+_http.mount("https://", _http_adapter)
+
+# Background WhatsApp sends, sized like the server so every in-flight
+# conversation can deliver its reply at once, as when each webhook sent
+# its own; a slow WAHA then can't queue replies behind a few workers
+_background = ThreadPoolExecutor(
+    max_workers=WAITRESS_THREADS, thread_name_prefix="waha-send"
+)
+# Long-lived pool for /health fan-out; kept apart so slow sends can't starve
+# it, and sized so every server thread's two probes can run at once
+_probes = ThreadPoolExecutor(
+    max_workers=WAITRESS_THREADS * 2, thread_name_prefix="health-probe"
+)
+
 # ---------------------------------------------------------------------------
 # In-memory helpers
 # ---------------------------------------------------------------------------
-_rate: dict[str, list[float]] = {}
+_rate: defaultdict[str, deque[float]] = defaultdict(deque)
+_rate_lock = threading.Lock()
 _seen: dict[str, float] = {}
+_health_cache: dict[str, tuple[float, bool]] = {}
+_health_locks: dict[str, threading.Lock] = {
+    url: threading.Lock() for url in (WAHA_HEALTH_URL, N8N_HEALTH_URL)
+}
 
 
 def _rate_ok(phone: str) -> bool:
     """Return True if *phone* is under the per-minute rate limit."""
-    now = time.time()
+    now = time.monotonic()
     cutoff = now - 60
-    ts = [t for t in _rate.get(phone, []) if t > cutoff]
-    if len(ts) >= MAX_REQUESTS_PER_MINUTE:
-        return False
-    ts.append(now)
-    _rate[phone] = ts
-    return True
+    # Server threads share the deques; prune-and-append must be atomic.
+    with _rate_lock:
+        ts = _rate[phone]
+        # Timestamps are appended in order, so expired ones sit at the left.
+        while ts and ts[0] <= cutoff:
+            ts.popleft()
+        if len(ts) >= MAX_REQUESTS_PER_MINUTE:
+            return False
+        ts.append(now)
+        return True
 
 
 def _dedup(msg_id: str | None) -> bool:
     """Return True if *msg_id* was already processed (within 5 min)."""
     if not msg_id:
         return False
-    now = time.time()
+    now = time.monotonic()
     # Prune old entries every 50 calls
     if len(_seen) > 500:
         _seen.clear()
@@ -90,29 +161,43 @@ def _dedup(msg_id: str | None) -> bool:
 def waha_send_text(chat_id: str, text: str) -> bool:
     """Send a text message through the WAHA/Baileys service."""
     try:
-        r = requests.post(
-            WAHA_URL if "/api/" in WAHA_URL else f"{WAHA_URL}/api/sendText",
+        r = _http.post(
+            WAHA_SEND_URL,
             json={"chatId": chat_id, "text": text, "session": "default"},
             timeout=15,
         )
         return r.ok
     except Exception as e:
-        logger.error(f"WAHA send failed: {e}")
+        logger.error("WAHA send failed: %s", e)
         return False
 
 
+def _probe(url: str) -> bool:
+    """HEAD *url*, reusing a result younger than HEALTH_CACHE_TTL."""
+    cached = _health_cache.get(url)
+    if cached and time.monotonic() - cached[0] < HEALTH_CACHE_TTL:
+        return cached[1]
+    # One probe per URL at a time; callers that queued behind it re-check
+    # the cache and reuse its result instead of probing again.
+    with _health_locks[url]:
+        cached = _health_cache.get(url)
+        if cached and time.monotonic() - cached[0] < HEALTH_CACHE_TTL:
+            return cached[1]
+        try:
+            ok = _http.head(url, timeout=5).ok
+        except Exception:
+            ok = False
+        # Stamp after the probe so a slow (up to 5 s) check still caches
+        _health_cache[url] = (time.monotonic(), ok)
+        return ok
+
+
 def waha_healthy() -> bool:
-    try:
-        return requests.get(WAHA_HEALTH_URL, timeout=5).ok
-    except Exception:
-        return False
+    return _probe(WAHA_HEALTH_URL)
 
 
 def n8n_healthy() -> bool:
-    try:
-        return requests.get(f"{N8N_WEBHOOK_URL}/healthz", timeout=5).ok
-    except Exception:
-        return False
+    return _probe(N8N_HEALTH_URL)
 
 
 # ---------------------------------------------------------------------------
@@ -136,11 +221,14 @@ def index():
 
 @app.route("/health")
 def health():
+    # Probe both upstreams at once so /health costs one timeout, not two.
+    n8n_ok = _probes.submit(n8n_healthy)
+    waha_ok = _probes.submit(waha_healthy)
     return jsonify({
         "status": "healthy",
         "mode": "n8n-relay",
-        "n8n": "connected" if n8n_healthy() else "unreachable",
-        "whatsapp": "connected" if waha_healthy() else "unreachable",
+        "n8n": "connected" if n8n_ok.result() else "unreachable",
+        "whatsapp": "connected" if waha_ok.result() else "unreachable",
         "timestamp": datetime.now().isoformat(),
     })
 
@@ -153,7 +241,7 @@ def webhook():
     if request.method == "GET":
         return jsonify({"status": "online", "mode": "n8n-relay"})
 
-    start = time.time()
+    start = time.perf_counter()
     data = request.get_json(silent=True) or {}
     if not data:
         return jsonify({"status": "ignored", "reason": "no_data"}), 200
@@ -179,17 +267,17 @@ def webhook():
         return jsonify({"status": "ignored", "reason": "missing_data"}), 200
 
     if not _rate_ok(phone):
-        logger.warning(f"Rate-limited: {phone}")
+        logger.warning("Rate-limited: %s", phone)
         return jsonify({"status": "rate_limited"}), 200
 
     # --- forward to n8n --------------------------------------------------
-    n8n_url = f"{N8N_WEBHOOK_URL}{N8N_WEBHOOK_PATH}"
-    logger.info(f"→ n8n | {phone}: {body[:80]}")
+    logger.info("→ n8n | %s: %.80s", phone, body)
 
     try:
-        resp = requests.post(
-            n8n_url,
-            json=data,  # forward the raw WAHA payload
+        resp = _http.post(
+            N8N_FORWARD_URL,
+            # forward the raw WAHA payload as received — no re-encode
+            data=request.get_data(),
             headers={"Content-Type": "application/json"},
             timeout=N8N_TIMEOUT,
         )
@@ -205,28 +293,32 @@ def webhook():
                     or result.get("output")
                 )
                 if reply:
-                    waha_send_text(phone, reply)
+                    _background.submit(waha_send_text, phone, reply)
             except ValueError:
                 pass  # n8n returned non-JSON (e.g. 200 empty) — that's fine
 
-            elapsed = int((time.time() - start) * 1000)
+            elapsed = int((time.perf_counter() - start) * 1000)
             return jsonify({"status": "ok", "ms": elapsed}), 200
         else:
-            logger.error(f"n8n returned {resp.status_code}: {resp.text[:200]}")
-            waha_send_text(
+            logger.error("n8n returned %s: %.200s", resp.status_code, resp.text)
+            _background.submit(
+                waha_send_text,
                 phone,
                 "⚠️ I'm having trouble processing your message. Please try again in a moment.",
             )
             return jsonify({"status": "n8n_error", "code": resp.status_code}), 200
 
     except requests.Timeout:
-        logger.error(f"n8n timed out ({N8N_TIMEOUT}s)")
-        waha_send_text(phone, "⏳ That took too long — please try again.")
+        logger.error("n8n timed out (%ss)", N8N_TIMEOUT)
+        _background.submit(
+            waha_send_text, phone, "⏳ That took too long — please try again."
+        )
         return jsonify({"status": "timeout"}), 200
 
     except Exception as e:
-        logger.error(f"n8n forward error: {e}")
-        waha_send_text(
+        logger.error("n8n forward error: %s", e)
+        _background.submit(
+            waha_send_text,
             phone,
             "⚠️ Something went wrong on my end. Please try again later.",
         )
@@ -252,9 +344,8 @@ def send():
 # ---------------------------------------------------------------------------
 @app.route("/whatsapp-status")
 def whatsapp_status():
-    base = WAHA_URL.rsplit("/api", 1)[0] if "/api/" in WAHA_URL else WAHA_URL
     try:
-        r = requests.get(f"{base}/api/sessions/default", timeout=5)
+        r = _http.get(f"{WAHA_BASE_URL}/api/sessions/default", timeout=5)
         return jsonify(r.json())
     except Exception as e:
         return jsonify({"status": "unreachable", "error": str(e)})
@@ -262,9 +353,8 @@ def whatsapp_status():
 
 @app.route("/whatsapp-qr")
 def whatsapp_qr():
-    base = WAHA_URL.rsplit("/api", 1)[0] if "/api/" in WAHA_URL else WAHA_URL
     try:
-        r = requests.get(f"{base}/api/qr", timeout=10)
+        r = _http.get(f"{WAHA_BASE_URL}/api/qr", timeout=10)
         return jsonify(r.json())
     except Exception as e:
         return jsonify({"error": str(e)}), 502
@@ -274,7 +364,7 @@ def whatsapp_qr():
 def n8n_status():
     return jsonify({
         "url": N8N_WEBHOOK_URL,
-        "webhook": f"{N8N_WEBHOOK_URL}{N8N_WEBHOOK_PATH}",
+        "webhook": N8N_FORWARD_URL,
         "healthy": n8n_healthy(),
     })
 
@@ -284,8 +374,17 @@ def n8n_status():
 # ---------------------------------------------------------------------------
 if __name__ == "__main__":
     logger.info(
-        f"🚀 Wednesday relay starting — "
-        f"n8n={N8N_WEBHOOK_URL}, waha={WAHA_URL}"
+        "🚀 Wednesday relay starting — n8n=%s, waha=%s",
+        N8N_WEBHOOK_URL,
+        WAHA_URL,
     )
-    debug = os.getenv("FLASK_DEBUG", "false").lower() == "true"
-    app.run(host="0.0.0.0", port=5000, debug=debug, threaded=True)
+    if os.getenv("FLASK_DEBUG", "false").lower() == "true":
+        app.run(host="0.0.0.0", port=5000, debug=True, threaded=True)
+    else:
+        serve(
+            app,
+            host="0.0.0.0",
+            port=5000,
+            threads=WAITRESS_THREADS,
+            connection_limit=max(200, WAITRESS_THREADS * 2),
+        )